@@ -4,11 +4,23 @@ from aiogram import Bot, Dispatcher
 
 from config.config import Config, load_config
 from log_setup.logging import setup_logging
-from db.database import init_db
+from db.database import close_db, init_db, ReadSessionLocal
 from keyboards.menu_commands import set_main_menu
+from middlewares.middlewares import DbSessionMiddleware, ThrottlingRequestMiddleware
 
 from handlers.user import router as user_router
 from handlers.admin import router as admin_router
+from utils.tasks import wait_background_tasks
+
+# How long shutdown waits for background tasks (referrer credits, replies)
+SHUTDOWN_TASKS_TIMEOUT = 30
+
+
+async def on_shutdown():
+    # Let pending referrer credits commit before the engines are disposed
+    await wait_background_tasks(SHUTDOWN_TASKS_TIMEOUT)
+    await close_db()
+
 
 async def main():
 
@@ -23,6 +35,10 @@ async def main():
     # Create bot and set token
     bot = Bot(config.bot.token)
     dp = Dispatcher()
+    dp.shutdown.register(on_shutdown)
+
+    # Queue outgoing messages within Bot API limits instead of hitting 429
+    bot.session.middleware(ThrottlingRequestMiddleware())
 
     # Initialize database
     await init_db()
@@ -30,6 +46,9 @@ async def main():
     # Setup main menu commands
     await set_main_menu(bot)
 
+    # One read-only DB session per message, shared by filters and handlers
+    dp.message.outer_middleware(DbSessionMiddleware(ReadSessionLocal))
+
     # Include routers
     dp.include_router(admin_router)
     dp.include_router(user_router)
@@ -48,6 +67,3 @@ async def main():
 
 if __name__ == "__main__":
     asyncio.run(main())
-
-if __name__ == "__main__":
-    asyncio.run(main())
@@ -5,6 +5,8 @@
 """
 
 from dataclasses import dataclass
+from functools import lru_cache
+
 from environs import Env
 
 
@@ -26,10 +28,10 @@ class TgBot:
     
     Атрибуты:
         token (str): API токен бота для аутентификации в Telegram
-        admin_ids (list[int]): Список Telegram ID администраторов бота
+        admin_ids (frozenset[int]): Множество Telegram ID администраторов бота
     """
     token: str
-    admin_ids: list[int]
+    admin_ids: frozenset[int]
 
 
 @dataclass
@@ -44,6 +46,7 @@ class Config:
     channal: ChannalSet
 
 
+@lru_cache(maxsize=1)
 def load_config(path: str | None = None) -> Config:
     """Загружает конфигурацию из переменных окружения.
     
@@ -60,6 +63,9 @@ def load_config(path: str | None = None) -> Config:
     Возвращает:
         Config: Объект конфигурации с загруженными параметрами
     
+    Примечания:
+        - Результат кешируется: .env читается один раз за процесс
+    
     Примеры .env файла:
         BOT_TOKEN=123456789:ABCdefGHIjklMNOpqrsTUVwxyz
         ADMIN_IDS=123456789,987654321
@@ -73,7 +79,7 @@ def load_config(path: str | None = None) -> Config:
     return Config(
         bot=TgBot(
             token=env('BOT_TOKEN'),
-            admin_ids=list(map(int, env.list('ADMIN_IDS')))
+            admin_ids=frozenset(map(int, env.list('ADMIN_IDS')))
         ),
         channal=ChannalSet(
             id=env.int('CHANNEL_ID'),
@@ -1,48 +1,196 @@
 from typing import AsyncGenerator
 from pathlib import Path
 
+from sqlalchemy import event, text
 from sqlalchemy.ext.asyncio import (
     AsyncSession,
     async_sessionmaker,
     create_async_engine,
 )
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from db.models import Base
+from db.requests_db import UserRepository
 
 # Ensure data directory exists
 DATA_DIR = Path(__file__).parent.parent.parent / "data"
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
+DB_PATH = DATA_DIR / "bot.db"
+
 # SQLite URL для async драйвера
-DATABASE_URL = f"sqlite+aiosqlite:///{DATA_DIR / 'bot.db'}"
+DATABASE_URL = f"sqlite+aiosqlite:///{DB_PATH}"
+
+# Read-only URI: SQLite открывает файл в режиме mode=ro
+READ_DATABASE_URL = f"sqlite+aiosqlite:///file:{DB_PATH}?mode=ro&uri=true"
 
 
-async_engine = create_async_engine(
+# SQLite сериализует запись, поэтому для записи держим одно соединение,
+# а чтение обслуживает отдельный небольшой пул.
+# pool_pre_ping выключен: у файловой SQLite соединения не "протухают",
+# а SELECT 1 перед каждой выдачей из пула стоил бы лишнего прохода через поток aiosqlite
+write_engine = create_async_engine(
     DATABASE_URL,
     echo=False,
     future=True,
-    pool_pre_ping=True,
-    pool_size=5,
-    max_overflow=10,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_pre_ping=False,
+    pool_size=1,
+    max_overflow=0,
+    # Fail fast instead of queueing forever behind a stuck writer
+    pool_timeout=10,
+    connect_args={"check_same_thread": False, "timeout": 30},
 )
 
+read_engine = create_async_engine(
+    READ_DATABASE_URL,
+    echo=False,
+    future=True,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_pre_ping=False,
+    pool_size=4,
+    max_overflow=0,
+    pool_timeout=10,
+    # Reads never write, so skip transaction bookkeeping: no implicit BEGIN
+    # and no ROLLBACK when the connection goes back to the pool
+    isolation_level="AUTOCOMMIT",
+    pool_reset_on_return=None,
+    connect_args={"check_same_thread": False},
+)
+
+_COMMON_PRAGMAS = (
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA foreign_keys=ON",
+)
+
+# journal_mode хранится в файле БД, поэтому переключать его
+# нужно только со стороны пишущего соединения
+_WRITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    *_COMMON_PRAGMAS,
+)
+
+
+def _pragmas_listener(pragmas: tuple[str, ...]):
+    """Создать обработчик события connect, применяющий PRAGMA к соединению.
+
+    WAL позволяет читать во время записи, synchronous=NORMAL убирает
+    лишний fsync на каждый commit. foreign_keys в SQLite выключены
+    по умолчанию и включаются отдельно для каждого соединения.
+    """
+
+    def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return _set_sqlite_pragmas
+
+
+event.listen(write_engine.sync_engine, "connect", _pragmas_listener(_WRITE_PRAGMAS))
+event.listen(read_engine.sync_engine, "connect", _pragmas_listener(_COMMON_PRAGMAS))
+
+# Сессии для операций, изменяющих данные
 AsyncSessionLocal = async_sessionmaker(
-    async_engine,
+    write_engine,
     class_=AsyncSession,
     expire_on_commit=False,
     autoflush=False,
 )
 
+# Сессии только для чтения (get_user_by_*, списки, статистика)
+ReadSessionLocal = async_sessionmaker(
+    read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autoflush=False,
+)
+
+
+def _create_missing_indexes(sync_conn) -> None:
+    """Создать индексы, объявленные в моделях, которых ещё нет в БД.
+
+    create_all создаёт индексы только вместе с новой таблицей, поэтому
+    в уже существующую БД индексы, добавленные позже, сами не попадут.
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+
+# Индексы ранних версий схемы, которые заменены составными индексами
+# моделей (или не нужны запросам). create_all их не удаляет, поэтому
+# в старой БД они остались бы лишними B-деревьями на каждую запись.
+# ix_users_user_hash не трогаем: в старых БД только он обеспечивает
+# уникальность user_hash
+_LEGACY_INDEXES = (
+    "ix_users_username",
+    "ix_users_invited_by_hash",
+    "ix_transactions_user_id",
+    "ix_transactions_created_at",
+    "ix_usage_user_id",
+    "ix_usage_used_at",
+)
+
+
+# Счётчики для /admin_stats: строка stats заполняется из текущих данных
+# один раз, дальше её поддерживают триггеры. Все выражения идемпотентны
+_STATS_DDL = (
+    """
+    INSERT OR IGNORE INTO stats (id, users_count, total_coins)
+    SELECT 1, COUNT(*), COALESCE(SUM(coins), 0) FROM users
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_users_stats_insert AFTER INSERT ON users
+    BEGIN
+        UPDATE stats SET users_count = users_count + 1,
+                         total_coins = total_coins + COALESCE(NEW.coins, 0)
+        WHERE id = 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_users_stats_update AFTER UPDATE OF coins ON users
+    BEGIN
+        UPDATE stats SET total_coins = total_coins
+                         + COALESCE(NEW.coins, 0) - COALESCE(OLD.coins, 0)
+        WHERE id = 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_users_stats_delete AFTER DELETE ON users
+    BEGIN
+        UPDATE stats SET users_count = users_count - 1,
+                         total_coins = total_coins - COALESCE(OLD.coins, 0)
+        WHERE id = 1;
+    END
+    """,
+)
+
 
 async def init_db() -> None:
-    """Инициализация базы данных - создание таблиц."""
-    async with async_engine.begin() as conn:
+    """Инициализация базы данных - создание таблиц, индексов и прогрев кеша запросов."""
+    async with write_engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_create_missing_indexes)
+        for index_name in _LEGACY_INDEXES:
+            await conn.execute(text(f"DROP INDEX IF EXISTS {index_name}"))
+        for statement in _STATS_DDL:
+            await conn.execute(text(statement))
+
+    # Compiled statement cache is per engine, warm both
+    for session_factory in (AsyncSessionLocal, ReadSessionLocal):
+        async with session_factory() as session:
+            await UserRepository.warm_up(session)
 
 
 async def close_db() -> None:
-    """Закрытие подключения к БД."""
-    await async_engine.dispose()
+    """Закрытие подключений к БД."""
+    await read_engine.dispose()
+    await write_engine.dispose()
 
 
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
@@ -52,3 +200,4 @@ async def get_session() -> AsyncGenerator[AsyncSession, None]:
             yield session
         finally:
             await session.close()
+
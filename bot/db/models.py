@@ -1,25 +1,34 @@
 from datetime import datetime, timedelta
 from typing import Optional
 
-from sqlalchemy import String, Integer, DateTime, ForeignKey, func
+from sqlalchemy import String, Integer, DateTime, ForeignKey, Index, func
+from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import declarative_base, Mapped, mapped_column, relationship
 
-Base = declarative_base()
+# AsyncAttrs allows `await user.awaitable_attrs.transactions` for lazy relationships
+Base = declarative_base(cls=AsyncAttrs)
 
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Matches get_user_referrals(); also serves lookups by invited_by_hash alone
+        Index("ix_users_invited_by_hash_id", "invited_by_hash", "id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     tg_id: Mapped[int] = mapped_column(Integer, unique=True, index=True)
-    username: Mapped[str] = mapped_column(String(255), nullable=True, index=True)
+    username: Mapped[str] = mapped_column(String(255), nullable=True)
     registered_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now()
     )
-    user_hash: Mapped[str] = mapped_column(String(64), unique=True, index=True)
+    # 12 lowercase chars (base36 of tg_id, or legacy hex) from
+    # utils.helpers.generate_user_hash;
+    # the UNIQUE constraint doubles as the lookup index for get_user_by_hash
+    user_hash: Mapped[str] = mapped_column(String(12), unique=True)
     invited_count: Mapped[int] = mapped_column(Integer, default=0)
     invited_by_hash: Mapped[Optional[str]] = mapped_column(
-        String(64), nullable=True, index=True
+        String(12), nullable=True
     )
     coins: Mapped[int] = mapped_column(Integer, default=2)
     referral_earnings: Mapped[int] = mapped_column(Integer, default=0)
@@ -43,13 +52,17 @@ class User(Base):
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    __table_args__ = (
+        # Matches get_user_transactions(): WHERE user_id ORDER BY created_at DESC
+        Index("ix_tx_user_created", "user_id", "created_at"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     amount: Mapped[int] = mapped_column(Integer)
     description: Mapped[str] = mapped_column(String(500))
     created_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True), server_default=func.now(), index=True
+        DateTime(timezone=True), server_default=func.now()
     )
 
     # Relationships
@@ -61,12 +74,16 @@ class Transaction(Base):
 
 class Usage(Base):
     __tablename__ = "usage"
+    __table_args__ = (
+        # Matches get_user_usage() and the period filter in get_usage_stats()
+        Index("ix_usage_user_used", "user_id", "used_at"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     coins_used: Mapped[int] = mapped_column(Integer)
     used_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True), server_default=func.now(), index=True
+        DateTime(timezone=True), server_default=func.now()
     )
 
     # Relationships
@@ -74,3 +91,17 @@ class Usage(Base):
 
     def __repr__(self) -> str:
         return f"<Usage(id={self.id}, user_id={self.user_id}, coins_used={self.coins_used})>"
+
+
+# Single-row counters for /admin_stats, kept in sync by triggers on users
+# (see db.database._STATS_DDL)
+class Stats(Base):
+    __tablename__ = "stats"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    users_count: Mapped[int] = mapped_column(Integer, default=0)
+    total_coins: Mapped[int] = mapped_column(Integer, default=0)
+
+    def __repr__(self) -> str:
+        return f"<Stats(users_count={self.users_count}, total_coins={self.total_coins})>"
+
@@ -1,10 +1,125 @@
-from datetime import datetime, timedelta
-from typing import Optional
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, NamedTuple, Optional
 
-from sqlalchemy import select, desc, and_
+from sqlalchemy import Integer, select, insert, update, desc, and_, func, bindparam, cast
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased, load_only, selectinload
+
+from db.models import Stats, User, Transaction, Usage
+from utils.cache import TTLCache
+
+# Hot lookups are built once at import; SQLAlchemy then compiles each of them
+# once per engine (see warm_up() called from init_db())
+_USER_BY_TG_ID = select(User).where(User.tg_id == bindparam("tg_id"))
+_USER_BY_HASH = select(User).where(User.user_hash == bindparam("user_hash"))
+
+# Column names accepted by UserRepository.update_user()
+_USER_COLUMNS = frozenset(column.key for column in User.__table__.columns)
+
+
+class UserSnapshot(NamedTuple):
+    """Лёгкий снимок пользователя для кеша горячих чтений (/profile, /balance...)."""
+
+    id: int
+    tg_id: int
+    username: Optional[str]
+    coins: int
+    user_hash: str
+    invited_count: int
+    referral_earnings: int
+    subscription_until: datetime
+    invited_by_hash: Optional[str]
+
+
+# Only the snapshot columns are selected: rows come back as plain tuples,
+# with no ORM instance construction or identity-map bookkeeping
+_SNAPSHOT_COLUMNS = tuple(getattr(User, name) for name in UserSnapshot._fields)
+_SNAPSHOT_BY_TG_ID = select(*_SNAPSHOT_COLUMNS).where(User.tg_id == bindparam("tg_id"))
+
+# tg_id -> UserSnapshot; every user mutation below invalidates its entry
+USER_CACHE_TTL = 30
+_user_cache = TTLCache(maxsize=10_000, ttl=USER_CACHE_TTL)
+
+
+async def _update_user(session: AsyncSession, user_id: int, **values) -> Optional[User]:
+    """Обновить пользователя одним UPDATE ... RETURNING и зафиксировать транзакцию.
+
+    Арифметика (coins + amount и т.п.) передаётся как SQL-выражение,
+    поэтому изменение атомарно и не требует предварительного SELECT.
+    Синхронизация сессии по умолчанию ('auto') обновляет по RETURNING
+    и уже загруженный в сессию объект, так что возвращаются новые значения.
+    """
+    stmt = (
+        update(User)
+        .where(User.id == user_id)
+        .values(**values)
+        .returning(User)
+    )
+    user = (await session.execute(stmt)).scalar_one_or_none()
+    await session.commit()
+    if user:
+        _user_cache.pop(user.tg_id)
+    return user
+
+
+def _days_modifier(days: int) -> str:
+    """Модификатор SQLite datetime() для сдвига на days дней, например '+3 days'."""
+    if isinstance(days, bool) or not isinstance(days, int):
+        raise TypeError(f"days must be int, got {type(days).__name__}")
+    return f"{days:+d} days"
+
+
+def _grant_values(coins: int, days: int) -> dict:
+    """Значения UPDATE для начисления монет и дней подписки.
+
+    Дни отсчитываются от большего из значений: текущей даты окончания
+    подписки или текущего момента. При days == 0 подписка не меняется.
+    """
+    values = {"coins": User.coins + coins}
+    if days:
+        values["subscription_until"] = func.datetime(
+            func.max(User.subscription_until, func.datetime("now")),
+            _days_modifier(days),
+        )
+    return values
+
+
+def _credit_referrer_stmt(inviter_hash: str, payment_amount: float):
+    """UPDATE, начисляющий пригласившему процент от платежа.
+
+    Возвращает (id, tg_id, начисленная сумма) через RETURNING.
+    """
+    bonus = cast(payment_amount * User.referral_percentage / 100.0, Integer)
+    return (
+        update(User)
+        .where(User.user_hash == inviter_hash)
+        .values(referral_earnings=User.referral_earnings + bonus)
+        .returning(User.id, User.tg_id, bonus)
+        .execution_options(synchronize_session=False)
+    )
+
+
+# Rows per executemany INSERT in bulk_create()
+BULK_INSERT_BATCH_SIZE = 500
+
+
+async def _bulk_insert(session: AsyncSession, model, rows: list[dict]) -> list[int]:
+    """Вставить строки пачками по BULK_INSERT_BATCH_SIZE и сделать один commit.
+
+    ID возвращаются в порядке rows: при executemany порядок строк
+    RETURNING сам по себе не гарантирован, поэтому он задаётся явно
+    через sort_by_parameter_order.
+    """
+    ids: list[int] = []
+    stmt = insert(model).returning(model.id, sort_by_parameter_order=True)
+    for start in range(0, len(rows), BULK_INSERT_BATCH_SIZE):
+        batch = rows[start:start + BULK_INSERT_BATCH_SIZE]
+        result = await session.execute(stmt, batch)
+        ids.extend(result.scalars().all())
+    await session.commit()
+    return ids
 
-from db.models import User, Transaction, Usage
 
 class UserRepository:
     """CRUD операции для User."""
@@ -19,136 +134,302 @@ class UserRepository:
         coins: int = 2,
     ) -> User:
         """Создать нового пользователя."""
-        user = User(
-            tg_id=tg_id,
-            username=username,
-            user_hash=user_hash,
-            invited_by_hash=invited_by_hash,
-            coins=coins,
-            subscription_until=datetime.utcnow() + timedelta(days=3),
+        stmt = (
+            insert(User)
+            .values(
+                tg_id=tg_id,
+                username=username,
+                user_hash=user_hash,
+                invited_by_hash=invited_by_hash,
+                coins=coins,
+                subscription_until=func.datetime("now", _days_modifier(3)),
+            )
+            .returning(User)
         )
-        session.add(user)
+        user = (await session.execute(stmt)).scalar_one()
         await session.commit()
-        await session.refresh(user)
+        return user
+
+    @staticmethod
+    async def create_user_with_referral(
+        session: AsyncSession,
+        tg_id: int,
+        user_hash: str,
+        username: Optional[str] = None,
+        invited_by_hash: Optional[str] = None,
+        coins: int = 2,
+        referral_bonus: int = 1,
+    ) -> Optional[User]:
+        """Создать пользователя и начислить бонус пригласившему в одной транзакции.
+
+        Пригласивший ищется подзапросом прямо в INSERT: если хеша нет,
+        invited_by_hash остаётся NULL. Собственный хеш пользователя
+        отбрасывается сразу, без обращения к БД.
+        Затем одним UPDATE пригласившему увеличивается invited_count и
+        начисляется referral_bonus. SQLite не поддерживает изменяющие
+        CTE, поэтому это два выражения, но с одним commit.
+
+        INSERT выполняется с ON CONFLICT DO NOTHING: если пользователь
+        уже создан параллельным апдейтом или user_hash занят (совпадение
+        со старым hex-хешем), возвращается None, а бонус не начисляется.
+        """
+        invited_by = None
+        # Нельзя пригласить самого себя
+        if invited_by_hash and invited_by_hash != user_hash:
+            inviter = aliased(User)
+            invited_by = (
+                select(inviter.user_hash)
+                .where(inviter.user_hash == invited_by_hash)
+                .scalar_subquery()
+            )
+
+        stmt = (
+            sqlite_insert(User)
+            .values(
+                tg_id=tg_id,
+                username=username,
+                user_hash=user_hash,
+                invited_by_hash=invited_by,
+                coins=coins,
+                subscription_until=func.datetime("now", _days_modifier(3)),
+            )
+            .on_conflict_do_nothing()
+            .returning(User)
+        )
+        user = (await session.execute(stmt)).scalar_one_or_none()
+        if user is None:
+            await session.rollback()
+            return None
+
+        if user.invited_by_hash:
+            result = await session.execute(
+                update(User)
+                .where(User.user_hash == user.invited_by_hash)
+                .values(
+                    invited_count=User.invited_count + 1,
+                    coins=User.coins + referral_bonus,
+                )
+                .returning(User.tg_id)
+                .execution_options(synchronize_session=False)
+            )
+            inviter_tg_id = result.scalar_one_or_none()
+        else:
+            inviter_tg_id = None
+
+        await session.commit()
+        if inviter_tg_id is not None:
+            _user_cache.pop(inviter_tg_id)
         return user
 
     @staticmethod
     async def get_user_by_id(session: AsyncSession, user_id: int) -> Optional[User]:
-        """Получить пользователя по ID."""
-        result = await session.execute(select(User).where(User.id == user_id))
-        return result.scalar_one_or_none()
+        """Получить пользователя по ID (сначала из identity map сессии).
+
+        Объект в identity map актуален после изменений через UserRepository:
+        _update_user применяет строку из RETURNING к загруженному объекту.
+        Изменения, сделанные в обход сессии, здесь видны не будут.
+        """
+        return await session.get(User, user_id)
 
     @staticmethod
     async def get_user_by_tg_id(session: AsyncSession, tg_id: int) -> Optional[User]:
         """Получить пользователя по Telegram ID."""
-        result = await session.execute(select(User).where(User.tg_id == tg_id))
+        result = await session.execute(_USER_BY_TG_ID, {"tg_id": tg_id})
         return result.scalar_one_or_none()
 
     @staticmethod
     async def get_user_by_hash(session: AsyncSession, user_hash: str) -> Optional[User]:
         """Получить пользователя по хешу."""
-        result = await session.execute(select(User).where(User.user_hash == user_hash))
+        result = await session.execute(_USER_BY_HASH, {"user_hash": user_hash})
         return result.scalar_one_or_none()
 
     @staticmethod
-    async def update_user(session: AsyncSession, user_id: int, **kwargs) -> Optional[User]:
-        """Обновить данные пользователя."""
-        user = await UserRepository.get_user_by_id(session, user_id)
-        if not user:
+    async def get_user_snapshot(
+        session: AsyncSession, tg_id: int
+    ) -> Optional[UserSnapshot]:
+        """Получить снимок пользователя по Telegram ID из кеша или БД.
+
+        Запись живёт USER_CACHE_TTL секунд и сбрасывается при любом
+        изменении пользователя через UserRepository.
+        """
+
+        async def load() -> Optional[UserSnapshot]:
+            result = await session.execute(_SNAPSHOT_BY_TG_ID, {"tg_id": tg_id})
+            row = result.one_or_none()
+            return UserSnapshot(*row) if row else None
+
+        return await _user_cache.get_or_load(tg_id, load)
+
+    @staticmethod
+    async def get_balance(session: AsyncSession, tg_id: int) -> Optional[int]:
+        """Получить баланс монет по Telegram ID.
+
+        Берётся из кеша снимков, если он есть, иначе читается
+        одна колонка users.coins.
+        """
+        snapshot = _user_cache.get(tg_id)
+        if snapshot is not None:
+            return snapshot.coins
+        result = await session.execute(select(User.coins).where(User.tg_id == tg_id))
+        return result.scalar_one_or_none()
+
+    @staticmethod
+    async def get_profile_bundle(
+        session: AsyncSession, tg_id: int
+    ) -> Optional[tuple[UserSnapshot, Optional[str]]]:
+        """Получить пользователя и username пригласившего одним запросом.
+
+        Пригласивший подтягивается LEFT JOIN по users.user_hash (уникальный
+        индекс), поэтому отдельный get_user_by_hash не нужен.
+
+        Возвращает:
+            Optional[tuple[UserSnapshot, Optional[str]]]: (снимок пользователя,
+            username пригласившего или None) либо None, если пользователь не найден
+        """
+        inviter = aliased(User)
+        result = await session.execute(
+            select(*_SNAPSHOT_COLUMNS, inviter.username)
+            .outerjoin(inviter, inviter.user_hash == User.invited_by_hash)
+            .where(User.tg_id == tg_id)
+        )
+        row = result.one_or_none()
+        if row is None:
             return None
+        *columns, inviter_username = row
+        return UserSnapshot(*columns), inviter_username
 
-        for key, value in kwargs.items():
-            if hasattr(user, key):
-                setattr(user, key, value)
+    @staticmethod
+    async def warm_up(session: AsyncSession) -> None:
+        """Прогреть кеш скомпилированных запросов горячих выборок.
 
-        await session.commit()
-        await session.refresh(user)
-        return user
+        Выполняет get_user_by_* с заведомо отсутствующими значениями,
+        чтобы первый реальный запрос не тратил время на компиляцию.
+        """
+        await UserRepository.get_user_by_id(session, 0)
+        await UserRepository.get_user_by_tg_id(session, 0)
+        await UserRepository.get_user_by_hash(session, "")
+
+    @staticmethod
+    async def get_user_with_transactions(
+        session: AsyncSession, user_id: int
+    ) -> Optional[User]:
+        """Получить пользователя вместе с транзакциями (без ленивой загрузки)."""
+        result = await session.execute(
+            select(User)
+            .where(User.id == user_id)
+            .options(
+                selectinload(User.transactions).options(
+                    load_only(Transaction.amount, Transaction.created_at)
+                )
+            )
+        )
+        return result.scalar_one_or_none()
+
+    @staticmethod
+    async def get_user_with_usage(
+        session: AsyncSession, user_id: int
+    ) -> Optional[User]:
+        """Получить пользователя вместе с историей использования (без ленивой загрузки)."""
+        result = await session.execute(
+            select(User)
+            .where(User.id == user_id)
+            .options(
+                selectinload(User.usage_records).options(
+                    load_only(Usage.coins_used, Usage.used_at)
+                )
+            )
+        )
+        return result.scalar_one_or_none()
+
+    @staticmethod
+    async def update_user(session: AsyncSession, user_id: int, **kwargs) -> Optional[User]:
+        """Обновить данные пользователя.
+
+        Неизвестные ключи (не являющиеся колонками users) игнорируются.
+        """
+        values = {key: value for key, value in kwargs.items() if key in _USER_COLUMNS}
+        if not values:
+            return await UserRepository.get_user_by_id(session, user_id)
+        return await _update_user(session, user_id, **values)
 
     @staticmethod
     async def add_coins(session: AsyncSession, user_id: int, amount: int) -> Optional[User]:
         """Добавить монеты пользователю."""
-        user = await UserRepository.get_user_by_id(session, user_id)
-        if not user:
-            return None
-
-        user.coins += amount
-        await session.commit()
-        await session.refresh(user)
-        return user
+        return await _update_user(session, user_id, coins=User.coins + amount)
 
     @staticmethod
     async def add_referral_earnings(session: AsyncSession, user_id: int, amount: int) -> Optional[User]:
         """Добавить заработок с реферальной системы пользователю."""
-        user = await UserRepository.get_user_by_id(session, user_id)
-        if not user:
-            return None
+        return await _update_user(session, user_id, referral_earnings=User.referral_earnings + amount)
 
-        user.referral_earnings += amount
+    @staticmethod
+    async def credit_referrer(
+        session: AsyncSession, inviter_hash: str, payment_amount: float
+    ) -> Optional[tuple[int, int]]:
+        """Начислить пригласившему процент от платежа одним UPDATE.
+
+        Вознаграждение int(payment_amount * referral_percentage / 100)
+        вычисляется в SQL из процента самой обновляемой строки, поэтому
+        между чтением процента и начислением нет окна гонки.
+
+        Возвращает:
+            Optional[tuple[int, int]]: (id пригласившего, начисленная сумма)
+            или None, если пользователя с таким хешем нет
+        """
+        result = await session.execute(_credit_referrer_stmt(inviter_hash, payment_amount))
+        row = result.one_or_none()
         await session.commit()
-        await session.refresh(user)
-        return user
+        if row is None:
+            return None
+        referrer_id, referrer_tg_id, amount = row
+        _user_cache.pop(referrer_tg_id)
+        return referrer_id, amount
 
     @staticmethod
     async def update_referral_percentage(session: AsyncSession, user_id: int, percentage: int) -> Optional[User]:
         """Обновить процент реферального вознаграждения пользователя."""
-        user = await UserRepository.get_user_by_id(session, user_id)
-        if not user:
-            return None
-
-        user.referral_percentage = percentage
-        await session.commit()
-        await session.refresh(user)
-        return user
+        return await _update_user(session, user_id, referral_percentage=percentage)
 
     @staticmethod
     async def subtract_coins(session: AsyncSession, user_id: int, amount: int) -> Optional[User]:
         """Вычесть монеты у пользователя."""
-        user = await UserRepository.get_user_by_id(session, user_id)
-        if not user:
-            return None
-
-        user.coins -= amount
-        await session.commit()
-        await session.refresh(user)
-        return user
+        return await _update_user(session, user_id, coins=User.coins - amount)
 
     @staticmethod
     async def increment_invited_count(session: AsyncSession, user_id: int) -> Optional[User]:
         """Увеличить счетчик приглашенных."""
-        user = await UserRepository.get_user_by_id(session, user_id)
-        if not user:
-            return None
-
-        user.invited_count += 1
-        await session.commit()
-        await session.refresh(user)
-        return user
+        return await _update_user(session, user_id, invited_count=User.invited_count + 1)
 
     @staticmethod
     async def update_subscription(session: AsyncSession, user_id: int, days: int = 3) -> Optional[User]:
-        """Обновить дату подписки."""
-        user = await UserRepository.get_user_by_id(session, user_id)
-        if not user:
-            return None
-
-        user.subscription_until = datetime.utcnow() + timedelta(days=days)
-        await session.commit()
-        await session.refresh(user)
-        return user
+        """Обновить дату подписки (отсчёт от текущего момента)."""
+        return await _update_user(
+            session,
+            user_id,
+            subscription_until=func.datetime("now", _days_modifier(days)),
+        )
 
     @staticmethod
     async def extend_subscription(session: AsyncSession, user_id: int, days: int) -> Optional[User]:
         """Продлить подписку на указанное количество дней."""
-        user = await UserRepository.get_user_by_id(session, user_id)
-        if not user:
-            return None
+        # SQLite can't add an interval to DATETIME, shift it with datetime()
+        return await _update_user(
+            session,
+            user_id,
+            subscription_until=func.datetime(User.subscription_until, _days_modifier(days)),
+        )
 
-        # Extend the existing subscription
-        user.subscription_until = user.subscription_until + timedelta(days=days)
-        await session.commit()
-        await session.refresh(user)
-        return user
+    @staticmethod
+    async def apply_grant(
+        session: AsyncSession, user_id: int, coins: int, days: int
+    ) -> Optional[User]:
+        """Начислить монеты и дни подписки одним UPDATE.
+
+        Дни отсчитываются от большего из значений: текущей даты окончания
+        подписки или текущего момента, поэтому продление истёкшей подписки
+        не "сгорает" в прошлом. При days == 0 подписка не меняется.
+        """
+        return await _update_user(session, user_id, **_grant_values(coins, days))
 
     @staticmethod
     async def delete_user(session: AsyncSession, user_id: int) -> bool:
@@ -159,28 +440,101 @@ class UserRepository:
 
         await session.delete(user)
         await session.commit()
+        _user_cache.pop(user.tg_id)
         return True
 
     @staticmethod
-    async def get_all_users(session: AsyncSession) -> list[User]:
-        """Получить всех пользователей."""
-        result = await session.execute(select(User))
+    async def get_all_users(
+        session: AsyncSession,
+        offset: int = 0,
+        limit: int = 1000,
+    ) -> list[User]:
+        """Получить страницу пользователей (не более limit записей).
+
+        Для обхода всей таблицы используйте iter_all_users.
+        """
+        result = await session.execute(
+            select(User).order_by(User.id).offset(offset).limit(limit)
+        )
         return result.scalars().all()
 
+    @staticmethod
+    async def get_users_page(
+        session: AsyncSession,
+        offset: int = 0,
+        limit: int = 30,
+    ) -> list[tuple[int, str, int]]:
+        """Получить страницу пользователей для /admin_users.
+
+        Возвращает только (tg_id, user_hash, coins) без загрузки ORM-объектов.
+        """
+        result = await session.execute(
+            select(User.tg_id, User.user_hash, User.coins)
+            .order_by(User.id)
+            .offset(offset)
+            .limit(limit)
+        )
+        return result.all()
+
+    @staticmethod
+    async def iter_all_users(session: AsyncSession) -> AsyncIterator[User]:
+        """Потоково перебрать всех пользователей пачками по 500 строк."""
+        result = await session.stream_scalars(
+            select(User).order_by(User.id).execution_options(yield_per=500)
+        )
+        async for user in result:
+            yield user
+
     @staticmethod
     async def get_users_count(session: AsyncSession) -> int:
         """Получить количество пользователей."""
-        result = await session.execute(select(User))
-        return len(result.scalars().all())
+        result = await session.execute(select(func.count()).select_from(User))
+        return result.scalar_one()
 
     @staticmethod
-    async def get_user_referrals(session: AsyncSession, user_hash: str) -> list[User]:
-        """Получить всех рефералов пользователя по его хешу."""
+    async def get_stats(session: AsyncSession) -> tuple[int, int, float]:
+        """Получить количество пользователей, сумму и средний баланс монет.
+
+        Читает счётчики из таблицы stats (поддерживается триггерами),
+        средний баланс вычисляется из них.
+        """
+        result = await session.execute(
+            select(Stats.users_count, Stats.total_coins).where(Stats.id == 1)
+        )
+        row = result.one_or_none()
+        if row is None:
+            return 0, 0, 0.0
+        users_count, total_coins = row
+        avg_coins = total_coins / users_count if users_count else 0.0
+        return users_count, total_coins, avg_coins
+
+    @staticmethod
+    async def get_user_referrals(
+        session: AsyncSession,
+        user_hash: str,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> list[User]:
+        """Получить рефералов пользователя по его хешу (опционально постранично)."""
         result = await session.execute(
-            select(User).where(User.invited_by_hash == user_hash)
+            select(User)
+            .where(User.invited_by_hash == user_hash)
+            .order_by(User.id)
+            .offset(offset)
+            .limit(limit)
         )
         return result.scalars().all()
 
+    @staticmethod
+    async def get_referrals_count(session: AsyncSession, user_hash: str) -> int:
+        """Получить количество рефералов пользователя по его хешу."""
+        result = await session.execute(
+            select(func.count())
+            .select_from(User)
+            .where(User.invited_by_hash == user_hash)
+        )
+        return result.scalar_one()
+
 
 class TransactionRepository:
     """CRUD операции для Transaction."""
@@ -193,25 +547,30 @@ class TransactionRepository:
         description: str,
     ) -> Transaction:
         """Создать новую транзакцию."""
-        transaction = Transaction(
-            user_id=user_id,
-            amount=amount,
-            description=description,
+        stmt = (
+            insert(Transaction)
+            .values(user_id=user_id, amount=amount, description=description)
+            .returning(Transaction)
         )
-        session.add(transaction)
+        transaction = (await session.execute(stmt)).scalar_one()
         await session.commit()
-        await session.refresh(transaction)
         return transaction
 
+    @staticmethod
+    async def bulk_create(session: AsyncSession, rows: list[dict]) -> list[int]:
+        """Создать транзакции пачкой в одной транзакции БД.
+
+        Каждый элемент rows - словарь с ключами user_id, amount, description.
+        Возвращает ID созданных транзакций в порядке rows.
+        """
+        return await _bulk_insert(session, Transaction, rows)
+
     @staticmethod
     async def get_transaction_by_id(
         session: AsyncSession, transaction_id: int
     ) -> Optional[Transaction]:
-        """Получить транзакцию по ID."""
-        result = await session.execute(
-            select(Transaction).where(Transaction.id == transaction_id)
-        )
-        return result.scalar_one_or_none()
+        """Получить транзакцию по ID (сначала из identity map сессии)."""
+        return await session.get(Transaction, transaction_id)
 
     @staticmethod
     async def get_user_transactions(
@@ -241,10 +600,10 @@ class TransactionRepository:
     async def get_user_balance(session: AsyncSession, user_id: int) -> int:
         """Получить баланс пользователя по транзакциям."""
         result = await session.execute(
-            select(Transaction).where(Transaction.user_id == user_id)
+            select(func.coalesce(func.sum(Transaction.amount), 0))
+            .where(Transaction.user_id == user_id)
         )
-        transactions = result.scalars().all()
-        return sum(t.amount for t in transactions)
+        return result.scalar_one()
 
 
 class UsageRepository:
@@ -257,20 +616,28 @@ class UsageRepository:
         coins_used: int,
     ) -> Usage:
         """Создать запись использования."""
-        usage = Usage(
-            user_id=user_id,
-            coins_used=coins_used,
+        stmt = (
+            insert(Usage)
+            .values(user_id=user_id, coins_used=coins_used)
+            .returning(Usage)
         )
-        session.add(usage)
+        usage = (await session.execute(stmt)).scalar_one()
         await session.commit()
-        await session.refresh(usage)
         return usage
 
+    @staticmethod
+    async def bulk_create(session: AsyncSession, rows: list[dict]) -> list[int]:
+        """Создать записи использования пачкой в одной транзакции БД.
+
+        Каждый элемент rows - словарь с ключами user_id, coins_used.
+        Возвращает ID созданных записей в порядке rows.
+        """
+        return await _bulk_insert(session, Usage, rows)
+
     @staticmethod
     async def get_usage_by_id(session: AsyncSession, usage_id: int) -> Optional[Usage]:
-        """Получить запись использования по ID."""
-        result = await session.execute(select(Usage).where(Usage.id == usage_id))
-        return result.scalar_one_or_none()
+        """Получить запись использования по ID (сначала из identity map сессии)."""
+        return await session.get(Usage, usage_id)
 
     @staticmethod
     async def get_user_usage(
@@ -289,33 +656,29 @@ class UsageRepository:
     async def get_total_coins_used(session: AsyncSession, user_id: int) -> int:
         """Получить общее количество использованных монет."""
         result = await session.execute(
-            select(Usage).where(Usage.user_id == user_id)
+            select(func.coalesce(func.sum(Usage.coins_used), 0))
+            .where(Usage.user_id == user_id)
         )
-        usage_records = result.scalars().all()
-        return sum(u.coins_used for u in usage_records)
+        return result.scalar_one()
 
     @staticmethod
     async def get_usage_stats(
         session: AsyncSession, user_id: int, days: int = 7
     ) -> dict:
         """Получить статистику использования за период."""
-        from datetime import datetime, timedelta
-
-        start_date = datetime.utcnow() - timedelta(days=days)
+        start_date = datetime.now(timezone.utc) - timedelta(days=days)
         result = await session.execute(
-            select(Usage).where(
+            select(func.count(), func.coalesce(func.sum(Usage.coins_used), 0)).where(
                 and_(Usage.user_id == user_id, Usage.used_at >= start_date)
             )
         )
-        usage_records = result.scalars().all()
+        total_usages, total_coins_used = result.one()
         return {
             "period_days": days,
-            "total_usages": len(usage_records),
-            "total_coins_used": sum(u.coins_used for u in usage_records),
+            "total_usages": total_usages,
+            "total_coins_used": total_coins_used,
             "average_per_usage": (
-                sum(u.coins_used for u in usage_records) / len(usage_records)
-                if usage_records
-                else 0
+                total_coins_used / total_usages if total_usages else 0
             ),
         }
 
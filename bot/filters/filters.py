@@ -4,14 +4,15 @@
 таких как тип чата, наличие подписки и прав администратора.
 """
 
-from datetime import datetime
+import time
+from datetime import datetime, timezone
 from typing import Union
 
 from aiogram import types
 from aiogram.filters import BaseFilter
 from aiogram.types import Message, CallbackQuery
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from db.database import AsyncSessionLocal
 from db.requests_db import UserRepository
 
 
@@ -34,6 +35,13 @@ class IsPrivateChat(BaseFilter):
         return message.chat.type == "private"
 
 
+def _to_timestamp(value: datetime) -> float:
+    """Перевести дату из БД в unix-время (SQLite возвращает naive UTC)."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
 class IsHavePodpiska(BaseFilter):
     """Фильтр для проверки активной подписки пользователя.
     
@@ -45,18 +53,18 @@ class IsHavePodpiska(BaseFilter):
         False также возвращается если пользователь не найден в БД
     
     Примечания:
-        - Требует асинхронного доступа к БД
+        - Использует сессию из DbSessionMiddleware (data["session"])
+        - Дата окончания подписки берётся из снимка UserRepository.get_user_snapshot:
+          его кеш сбрасывается при любом изменении пользователя, поэтому
+          выданная админом подписка видна фильтру сразу
         - Проверяет subscription_until > текущее время
     """
 
-    async def __call__(self, message: Message) -> bool:
-        async with AsyncSessionLocal() as session:
-            user = await UserRepository.get_user_by_tg_id(
-                session, message.from_user.id
-            )
-            if not user:
-                return False
-            return user.subscription_until > datetime.now()
+    async def __call__(self, message: Message, session: AsyncSession) -> bool:
+        user = await UserRepository.get_user_snapshot(session, message.from_user.id)
+        if user is None:
+            return False
+        return _to_timestamp(user.subscription_until) > time.time()
 
 
 class AdminFilter(BaseFilter):
@@ -67,17 +75,19 @@ class AdminFilter(BaseFilter):
     
     Параметры:
         event (Union[Message, CallbackQuery]): Событие Telegram (сообщение или callback)
-        admin_ids (list[int]): Список Telegram ID администраторов
+        admin_ids (frozenset[int]): Множество Telegram ID администраторов
     
     Возвращает:
         bool: True если пользователь администратор, иначе False
     
     Примечания:
         - admin_ids передаются через dp.start_polling()
+        - admin_ids - frozenset из load_config(), проверка за O(1)
         - Работает с сообщениями и callback-кнопками
+        - Регистрируется на уровне роутера: router.message.filter(AdminFilter())
     """
 
     async def __call__(
-        self, event: Union[Message, CallbackQuery], admin_ids: list[int]
+        self, event: Union[Message, CallbackQuery], admin_ids: frozenset[int]
     ) -> bool:
         return event.from_user.id in admin_ids
\ No newline at end of file
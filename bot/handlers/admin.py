@@ -5,20 +5,82 @@
 различные операции по обслуживанию бота.
 """
 
+import logging
+import re
+
 from aiogram import Router
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.types import Message
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from db.database import AsyncSessionLocal
 from db.requests_db import UserRepository
 from filters.filters import AdminFilter
 from lexicon.lexicon import ADMIN_LEXICON
+from lexicon.render import render, render_parts
+from utils.tasks import spawn
+
+logger = logging.getLogger(__name__)
 
 router = Router(name="admin_router")
+# Checked once per message before any Command filter of this router, so
+# messages from non-admins are rejected without parsing the command
+router.message.filter(AdminFilter())
+
+# Command argument formats (matched against CommandObject.args).
+# Digit counts are bounded so every number fits SQLite's 64-bit INTEGER
+# (and days stay within the range datetime() can represent); longer input
+# gets the usage text instead of an OverflowError from the driver
+_ADD_TO_USER_RE = re.compile(r"(\d{1,18})\s+(-?\d{1,18})\s+(-?\d{1,5})")
+_ADD_REFERRAL_EARNINGS_RE = re.compile(r"(\S+)\s+(-?\d{1,18})")
+_SET_REFERRAL_PERCENTAGE_RE = re.compile(r"(\S+)\s+(-?\d{1,3})")
+# <tg_id|user_hash>: digits are tried as a tg_id first
+_TG_ID_RE = re.compile(r"\d{1,18}")
+
+
+async def _find_user(session: AsyncSession, user_identifier: str):
+    """Найти пользователя по tg_id или user_hash.
+
+    base36-хеш небольшого tg_id может состоять из одних цифр
+    (например, 000000000033), поэтому если по tg_id никого нет,
+    идентификатор ищется ещё и как хеш.
+    """
+    if _TG_ID_RE.fullmatch(user_identifier):
+        user = await UserRepository.get_user_by_tg_id(session, int(user_identifier))
+        if user:
+            return user
+    return await UserRepository.get_user_by_hash(session, user_identifier)
+
+
+# Static texts are assembled once at import instead of on every command
+_ADMIN_HELP_TEXT, _ADMIN_HELP_ENTITIES = render("".join(
+    ADMIN_LEXICON[key]
+    for key in (
+        "admin_help_header",
+        "admin_help_stats",
+        "admin_help_users",
+        "admin_help_add_to_user",
+        "admin_help_add_referral_earnings",
+        "admin_help_add_referral_coins",
+        "admin_help_add_referral_days",
+        "admin_help_set_referral_percentage",
+        "admin_help_help",
+    )
+))
+_ADMIN_STATS_TEMPLATE = "".join(
+    ADMIN_LEXICON[key]
+    for key in (
+        "admin_stats_header",
+        "admin_stats_users",
+        "admin_stats_total_coins",
+        "admin_stats_avg_coins",
+    )
+)
 
 
-@router.message(Command("admin_stats"), AdminFilter())
-async def admin_stats(message: Message) -> None:
+@router.message(Command("admin_stats"))
+async def admin_stats(message: Message, session: AsyncSession) -> None:
     """Обработчик команды /admin_stats - статистика базы данных.
     
     Выводит основную статистику по базе данных:
@@ -30,32 +92,29 @@ async def admin_stats(message: Message) -> None:
     
     Параметры:
         message (Message): Telegram сообщение с командой /admin_stats
+        session (AsyncSession): Сессия БД из DbSessionMiddleware
     
     Возвращает:
         None: Отправляет статистику или сообщение об отсутствии пользователей
     """
-    async with AsyncSessionLocal() as session:
-        users_count = await UserRepository.get_users_count(session)
-        
-        if users_count == 0:
-            await message.answer(ADMIN_LEXICON["admin_stats_empty"])
-            return
-            
-        all_users = await UserRepository.get_all_users(session)
-        total_coins = sum(user.coins for user in all_users)
-        avg_coins = total_coins / users_count
+    users_count, total_coins, avg_coins = await UserRepository.get_stats(session)
+    await session.close()
 
-        text = (
-            ADMIN_LEXICON["admin_stats_header"] +
-            ADMIN_LEXICON["admin_stats_users"].format(users_count=users_count) +
-            ADMIN_LEXICON["admin_stats_total_coins"].format(total_coins=total_coins) +
-            ADMIN_LEXICON["admin_stats_avg_coins"].format(avg_coins=avg_coins)
-        )
-        await message.answer(text, parse_mode="Markdown")
+    if users_count == 0:
+        await message.answer(ADMIN_LEXICON["admin_stats_empty"])
+        return
+
+    text, entities = render(
+        _ADMIN_STATS_TEMPLATE,
+        users_count=users_count,
+        total_coins=total_coins,
+        avg_coins=avg_coins,
+    )
+    await message.answer(text, entities=entities)
 
 
-@router.message(Command("admin_users"), AdminFilter())
-async def admin_users_list(message: Message) -> None:
+@router.message(Command("admin_users"))
+async def admin_users_list(message: Message, session: AsyncSession) -> None:
     """Обработчик команды /admin_users - список всех пользователей.
     
     Выводит список всех зарегистрированных пользователей с информацией:
@@ -71,35 +130,43 @@ async def admin_users_list(message: Message) -> None:
     
     Параметры:
         message (Message): Telegram сообщение с командой /admin_users
+        session (AsyncSession): Сессия БД из DbSessionMiddleware
     
     Возвращает:
         None: Отправляет список пользователей или уведомление о пустой БД
     """
-    async with AsyncSessionLocal() as session:
-        users = await UserRepository.get_all_users(session)
+    users_count = await UserRepository.get_users_count(session)
+    users = []
+    if users_count:
+        users = await UserRepository.get_users_page(session, limit=30)
+    await session.close()
 
-        if not users:
-            await message.answer(ADMIN_LEXICON["admin_users_empty"])
-            return
+    if users_count == 0:
+        await message.answer(ADMIN_LEXICON["admin_users_empty"])
+        return
 
-        text = ADMIN_LEXICON["admin_users_header"].format(count=len(users))
-        
-        # Show first 30 users
-        for i, user in enumerate(users[:30], 1):
-            text += ADMIN_LEXICON["admin_users_item"].format(
-                i=i,
-                tg_id=user.tg_id,
-                user_hash=user.user_hash[:12],
-                coins=user.coins,
-            )
+    parts = [(ADMIN_LEXICON["admin_users_header"], {"count": users_count})]
+    item_template = ADMIN_LEXICON["admin_users_item"]
+    
+    # Show first 30 users (the query is already LIMITed, no slicing)
+    parts.extend(
+        (item_template, {
+            "i": i,
+            "tg_id": tg_id,
+            "user_hash": user_hash[:12],
+            "coins": coins,
+        })
+        for i, (tg_id, user_hash, coins) in enumerate(users, 1)
+    )
 
-        if len(users) > 30:
-            text += ADMIN_LEXICON["admin_users_more"].format(count=len(users) - 30)
+    if users_count > 30:
+        parts.append((ADMIN_LEXICON["admin_users_more"], {"count": users_count - 30}))
 
-        await message.answer(text, parse_mode="Markdown")
+    text, entities = render_parts(parts)
+    await message.answer(text, entities=entities)
 
 
-@router.message(Command("admin_help"), AdminFilter())
+@router.message(Command("admin_help"))
 async def admin_help(message: Message) -> None:
     """Обработчик команды /admin_help - справка по административным командам.
     
@@ -116,22 +183,11 @@ async def admin_help(message: Message) -> None:
     Возвращает:
         None: Отправляет справку администратору
     """
-    text = (
-        ADMIN_LEXICON["admin_help_header"] +
-        ADMIN_LEXICON["admin_help_stats"] +
-        ADMIN_LEXICON["admin_help_users"] +
-        ADMIN_LEXICON["admin_help_add_to_user"] +
-        ADMIN_LEXICON["admin_help_add_referral_earnings"] +
-        ADMIN_LEXICON["admin_help_add_referral_coins"] +
-        ADMIN_LEXICON["admin_help_add_referral_days"] +
-        ADMIN_LEXICON["admin_help_set_referral_percentage"] +
-        ADMIN_LEXICON["admin_help_help"]
-    )
-    await message.answer(text, parse_mode="Markdown")
+    await message.answer(_ADMIN_HELP_TEXT, entities=_ADMIN_HELP_ENTITIES)
 
 
-@router.message(Command("add_to_user"), AdminFilter())
-async def add_to_user(message: Message) -> None:
+@router.message(Command("add_to_user"))
+async def add_to_user(message: Message, command: CommandObject) -> None:
     """Обработчик команды /add_to_user - добавить монеты и/или дни подписки пользователю.
     
     Формат команды: /add_to_user <tg_id> <coins> <days>
@@ -140,85 +196,78 @@ async def add_to_user(message: Message) -> None:
     /add_to_user 123456789 0 30      - добавить 30 дней подписки
     /add_to_user 123456789 100 30    - добавить 100 монет и 30 дней
     
+    Дни отсчитываются от даты окончания подписки, а если она уже
+    истекла - от текущего момента.
+    
     Доступно только администраторам.
     
     Параметры:
         message (Message): Telegram сообщение с командой /add_to_user
+        command (CommandObject): Разобранная команда, аргументы в command.args
     
     Возвращает:
         None: Отправляет результат операции
     """
     try:
         # Parse command arguments
-        args = message.text.split()[1:]
-        if len(args) != 3:
+        match = _ADD_TO_USER_RE.fullmatch((command.args or "").strip())
+        if not match:
             await message.answer(ADMIN_LEXICON["add_to_user_usage"])
             return
             
-        tg_id = int(args[0])
-        coins = int(args[1])
-        days = int(args[2])
+        tg_id, coins, days = map(int, match.groups())
         
         # Validate that at least one of coins or days is non-zero
         if coins == 0 and days == 0:
             await message.answer(ADMIN_LEXICON["add_to_user_usage"])
             return
         
+        # Replies are sent only after the block: waiting for a send slot
+        # must not hold the single write connection
+        updated_user = None
         async with AsyncSessionLocal() as session:
             # Find user by tg_id
             user = await UserRepository.get_user_by_tg_id(session, tg_id)
-            if not user:
-                await message.answer(ADMIN_LEXICON["user_not_found"].format(tg_id=tg_id))
-                return
-                
-            # Track what operations were performed
-            operations = []
-            
-            # Add coins to user if specified
-            if coins != 0:
-                updated_user = await UserRepository.add_coins(session, user.id, coins)
-                if updated_user:
-                    operations.append(
-                        ADMIN_LEXICON["add_coins_success"].format(
-                            tg_id=tg_id,
-                            amount=coins,
-                            new_balance=updated_user.coins
-                        )
-                    )
-                else:
-                    operations.append(ADMIN_LEXICON["operation_failed"] + " (монеты)")
-            
-            # Add days to user subscription if specified
-            if days != 0:
-                # Refresh user object to get latest data after coins update
-                if coins != 0:
-                    user = await UserRepository.get_user_by_id(session, user.id)
-                
-                updated_user = await UserRepository.extend_subscription(session, user.id, days)
-                if updated_user:
-                    operations.append(
-                        ADMIN_LEXICON["add_days_success"].format(
-                            tg_id=tg_id,
-                            days=days,
-                            new_date=updated_user.subscription_until.strftime("%d.%m.%Y %H:%M")
-                        )
-                    )
-                else:
-                    operations.append(ADMIN_LEXICON["operation_failed"] + " (подписка)")
-            
-            # Send combined result
-            if operations:
-                await message.answer("\n".join(operations))
-            else:
-                await message.answer(ADMIN_LEXICON["operation_failed"])
-    except ValueError:
-        await message.answer(ADMIN_LEXICON["add_to_user_usage"])
-    except Exception as e:
-        await message.answer(ADMIN_LEXICON["operation_failed"] + f"\nОшибка: {str(e)}")
-
-
-@router.message(Command("add_referral_earnings"), AdminFilter())
-async def add_referral_earnings(message: Message) -> None:
+            if user:
+                # Add coins and days in a single UPDATE
+                updated_user = await UserRepository.apply_grant(session, user.id, coins, days)
+
+        if not user:
+            await message.answer(ADMIN_LEXICON["user_not_found"].format(tg_id=tg_id))
+            return
+        if not updated_user:
+            await message.answer(ADMIN_LEXICON["operation_failed"])
+            return
+
+        # Track what operations were performed
+        operations = []
+        if coins != 0:
+            operations.append(
+                ADMIN_LEXICON["add_coins_success"].format(
+                    tg_id=tg_id,
+                    amount=coins,
+                    new_balance=updated_user.coins
+                )
+            )
+        if days != 0:
+            operations.append(
+                ADMIN_LEXICON["add_days_success"].format(
+                    tg_id=tg_id,
+                    days=days,
+                    new_date=updated_user.subscription_until.strftime("%d.%m.%Y %H:%M")
+                )
+            )
+
+        # Reply without waiting for the chat's send slot
+        spawn(message.answer("\n".join(operations)))
+    except SQLAlchemyError:
+        # Details go to the log, not to the chat
+        logger.exception("/add_to_user failed: %r", command.args)
+        await message.answer(ADMIN_LEXICON["operation_failed"])
+
+
+@router.message(Command("add_referral_earnings"))
+async def add_referral_earnings(message: Message, command: CommandObject) -> None:
     """Обработчик команды /add_referral_earnings - добавить заработок с реферальной системы пользователю.
     
     Формат команды: /add_referral_earnings <tg_id|user_hash> <amount>
@@ -230,53 +279,51 @@ async def add_referral_earnings(message: Message) -> None:
     
     Параметры:
         message (Message): Telegram сообщение с командой /add_referral_earnings
+        command (CommandObject): Разобранная команда, аргументы в command.args
     
     Возвращает:
         None: Отправляет результат операции
     """
     try:
         # Parse command arguments
-        args = message.text.split()[1:]
-        if len(args) != 2:
+        match = _ADD_REFERRAL_EARNINGS_RE.fullmatch((command.args or "").strip())
+        if not match:
             await message.answer(ADMIN_LEXICON["add_referral_earnings_usage"])
             return
             
-        user_identifier = args[0]
-        amount = int(args[1])
+        user_identifier = match.group(1)
+        amount = int(match.group(2))
         
+        # Replies are sent only after the block: waiting for a send slot
+        # must not hold the single write connection
+        updated_user = None
         async with AsyncSessionLocal() as session:
-            # Find user by tg_id or user_hash
-            if user_identifier.isdigit():
-                # It's a tg_id
-                user = await UserRepository.get_user_by_tg_id(session, int(user_identifier))
-            else:
-                # It's a user_hash
-                user = await UserRepository.get_user_by_hash(session, user_identifier)
-                
-            if not user:
-                await message.answer(ADMIN_LEXICON["user_not_found"].format(tg_id=user_identifier))
-                return
-                
-            # Add referral earnings to user
-            updated_user = await UserRepository.add_referral_earnings(session, user.id, amount)
-            if updated_user:
-                await message.answer(
-                    ADMIN_LEXICON["add_referral_earnings_success"].format(
-                        tg_id=user_identifier,
-                        amount=amount,
-                        new_earnings=updated_user.referral_earnings
-                    )
+            user = await _find_user(session, user_identifier)
+            if user:
+                # Add referral earnings to user
+                updated_user = await UserRepository.add_referral_earnings(session, user.id, amount)
+
+        if not user:
+            await message.answer(ADMIN_LEXICON["user_not_found"].format(tg_id=user_identifier))
+            return
+        if updated_user:
+            spawn(message.answer(
+                ADMIN_LEXICON["add_referral_earnings_success"].format(
+                    tg_id=user_identifier,
+                    amount=amount,
+                    new_earnings=updated_user.referral_earnings
                 )
-            else:
-                await message.answer(ADMIN_LEXICON["operation_failed"])
-    except ValueError:
-        await message.answer(ADMIN_LEXICON["add_referral_earnings_usage"])
-    except Exception as e:
-        await message.answer(ADMIN_LEXICON["operation_failed"] + f"\nОшибка: {str(e)}")
+            ))
+        else:
+            await message.answer(ADMIN_LEXICON["operation_failed"])
+    except SQLAlchemyError:
+        # Details go to the log, not to the chat
+        logger.exception("/add_referral_earnings failed: %r", command.args)
+        await message.answer(ADMIN_LEXICON["operation_failed"])
 
 
-@router.message(Command("set_referral_percentage"), AdminFilter())
-async def set_referral_percentage(message: Message) -> None:
+@router.message(Command("set_referral_percentage"))
+async def set_referral_percentage(message: Message, command: CommandObject) -> None:
     """Обработчик команды /set_referral_percentage - установить процент реферального вознаграждения пользователю.
     
     Формат команды: /set_referral_percentage <tg_id|user_hash> <percentage>
@@ -288,55 +335,53 @@ async def set_referral_percentage(message: Message) -> None:
     
     Параметры:
         message (Message): Telegram сообщение с командой /set_referral_percentage
+        command (CommandObject): Разобранная команда, аргументы в command.args
     
     Возвращает:
         None: Отправляет результат операции
     """
     try:
         # Parse command arguments
-        args = message.text.split()[1:]
-        if len(args) != 2:
+        match = _SET_REFERRAL_PERCENTAGE_RE.fullmatch((command.args or "").strip())
+        if not match:
             await message.answer(ADMIN_LEXICON["set_referral_percentage_usage"])
             return
             
-        user_identifier = args[0]
-        percentage = int(args[1])
+        user_identifier = match.group(1)
+        percentage = int(match.group(2))
         
         # Validate percentage range (0-100)
         if percentage < 0 or percentage > 100:
             await message.answer("❌ Процент должен быть в диапазоне от 0 до 100")
             return
         
+        # Replies are sent only after the block: waiting for a send slot
+        # must not hold the single write connection
+        updated_user = None
         async with AsyncSessionLocal() as session:
-            # Find user by tg_id or user_hash
-            if user_identifier.isdigit():
-                # It's a tg_id
-                user = await UserRepository.get_user_by_tg_id(session, int(user_identifier))
-            else:
-                # It's a user_hash
-                user = await UserRepository.get_user_by_hash(session, user_identifier)
-                
-            if not user:
-                await message.answer(ADMIN_LEXICON["user_not_found"].format(tg_id=user_identifier))
-                return
-                
-            # Store old percentage before updating
-            old_percentage = user.referral_percentage
-            
-            # Update referral percentage for user
-            updated_user = await UserRepository.update_referral_percentage(session, user.id, percentage)
-            if updated_user:
-                await message.answer(
-                    ADMIN_LEXICON["set_referral_percentage_success"].format(
-                        tg_id=user_identifier,
-                        percentage=updated_user.referral_percentage,
-                        old_percentage=old_percentage
-                    )
+            user = await _find_user(session, user_identifier)
+            if user:
+                # Store old percentage before updating
+                old_percentage = user.referral_percentage
+
+                # Update referral percentage for user
+                updated_user = await UserRepository.update_referral_percentage(session, user.id, percentage)
+
+        if not user:
+            await message.answer(ADMIN_LEXICON["user_not_found"].format(tg_id=user_identifier))
+            return
+        if updated_user:
+            spawn(message.answer(
+                ADMIN_LEXICON["set_referral_percentage_success"].format(
+                    tg_id=user_identifier,
+                    percentage=updated_user.referral_percentage,
+                    old_percentage=old_percentage
                 )
-            else:
-                await message.answer(ADMIN_LEXICON["operation_failed"])
-    except ValueError:
-        await message.answer(ADMIN_LEXICON["set_referral_percentage_usage"])
-    except Exception as e:
-        await message.answer(ADMIN_LEXICON["operation_failed"] + f"\nОшибка: {str(e)}")
+            ))
+        else:
+            await message.answer(ADMIN_LEXICON["operation_failed"])
+    except SQLAlchemyError:
+        # Details go to the log, not to the chat
+        logger.exception("/set_referral_percentage failed: %r", command.args)
+        await message.answer(ADMIN_LEXICON["operation_failed"])
 
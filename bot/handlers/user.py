@@ -7,21 +7,25 @@
 from aiogram import Router, types
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from db.database import AsyncSessionLocal
 from db.requests_db import UserRepository
 from lexicon.lexicon import USER_LEXICON
+from lexicon.render import render, render_parts
 from filters.filters import IsPrivateChat
 from utils.helpers import get_or_create_user
 
 router = Router(name="user_router")
 
+_USER_HELP_TEXT, _USER_HELP_ENTITIES = render(USER_LEXICON["user_help"])
+
 @router.message(Command("start"), IsPrivateChat())
 async def cmd_start(message: types.Message, state: FSMContext) -> None:
     """Обработчик команды /start - регистрация или вход пользователя.
     
     Обрабатывает начальную команду с опциональным реферальным хешем.
-    При первом входе создаёт пользователя с уникальным SHA256 хешем.
+    При первом входе создаёт пользователя с уникальным хешем.
     Если передан реферальный код - связывает с приглашающим и 
     увеличивает счётчик приглашений у приглашающего.
     
@@ -41,7 +45,10 @@ async def cmd_start(message: types.Message, state: FSMContext) -> None:
     # Extract referral hash from deep link (format: /start hash_value)
     invited_by_hash = None
     if message.text and len(message.text.split()) > 1:
-        invited_by_hash = message.text.split()[1]
+        # Hashes are stored lowercase (base36 or legacy hex); normalise
+        # here instead of comparing lower(user_hash), which could not use
+        # the unique index
+        invited_by_hash = message.text.split()[1].lower()
     
     async with AsyncSessionLocal() as session:
         user_data = await get_or_create_user(
@@ -51,15 +58,16 @@ async def cmd_start(message: types.Message, state: FSMContext) -> None:
             invited_by_hash=invited_by_hash,
         )
 
-        text = USER_LEXICON["user_start"].format(
+        text, entities = render(
+            USER_LEXICON["user_start"],
             hash=user_data["user_hash"][:12],
             coins=user_data["coins"]
         )
-    await message.answer(text, parse_mode="Markdown")
+    await message.answer(text, entities=entities)
 
 
 @router.message(Command("profile"), IsPrivateChat())
-async def cmd_profile(message: types.Message) -> None:
+async def cmd_profile(message: types.Message, session: AsyncSession) -> None:
     """Обработчик команды /profile - просмотр профиля пользователя.
     
     Выводит подробную информацию профиля, включающую:
@@ -71,32 +79,45 @@ async def cmd_profile(message: types.Message) -> None:
     
     Параметры:
         message (types.Message): Telegram сообщение с командой /profile
+        session (AsyncSession): Сессия БД из DbSessionMiddleware
     
     Возвращает:
         None: Отправляет информацию профиля или ошибку
     """
-    async with AsyncSessionLocal() as session:
-        user = await UserRepository.get_user_by_tg_id(session, message.from_user.id)
-
-        if not user:
-            await message.answer("❌ Пользователь не найден")
-            return
-
-        invited_by_info = f"🔗 Приглашен: {user.invited_by_hash[:12]}..." if user.invited_by_hash else "🔗 Приглашен: Нет"
-        
-        text = USER_LEXICON["user_profile"].format(
-            id=user.id,
-            tg_id=user.tg_id,
-            user_hash=user.user_hash[:12],
-            coins=user.coins,
-            invited=user.invited_count,
-            referral_earnings=user.referral_earnings,
-        ) + f"\n{invited_by_info}"
-    await message.answer(text, parse_mode="Markdown")
+    bundle = await UserRepository.get_profile_bundle(session, message.from_user.id)
+    await session.close()
+
+    if not bundle:
+        await message.answer("❌ Пользователь не найден")
+        return
+    user, inviter_username = bundle
+
+    if not user.invited_by_hash:
+        invited_by_info = "\n🔗 Приглашен: Нет"
+    elif inviter_username:
+        invited_by_info = "\n🔗 Приглашен: {hash}... (`@{username}`)"
+    else:
+        invited_by_info = "\n🔗 Приглашен: {hash}..."
+    
+    text, entities = render_parts((
+        (USER_LEXICON["user_profile"], {
+            "id": user.id,
+            "tg_id": user.tg_id,
+            "user_hash": user.user_hash[:12],
+            "coins": user.coins,
+            "invited": user.invited_count,
+            "referral_earnings": user.referral_earnings,
+        }),
+        (invited_by_info, {
+            "hash": (user.invited_by_hash or "")[:12],
+            "username": inviter_username,
+        }),
+    ))
+    await message.answer(text, entities=entities)
 
 
 @router.message(Command("balance"), IsPrivateChat())
-async def cmd_balance(message: types.Message) -> None:
+async def cmd_balance(message: types.Message, session: AsyncSession) -> None:
     """Обработчик команды /balance - проверка баланса монет.
     
     Показывает текущий баланс монет пользователя в системе.
@@ -105,21 +126,23 @@ async def cmd_balance(message: types.Message) -> None:
     
     Параметры:
         message (types.Message): Telegram сообщение с командой /balance
+        session (AsyncSession): Сессия БД из DbSessionMiddleware
     
     Возвращает:
         None: Отправляет текущий баланс или ошибку"""
-    async with AsyncSessionLocal() as session:
-        user = await UserRepository.get_user_by_tg_id(session, message.from_user.id)
-        if not user:
-            await message.answer("❌ Пользователь не найден")
-            return
+    coins = await UserRepository.get_balance(session, message.from_user.id)
+    await session.close()
+
+    if coins is None:
+        await message.answer("❌ Пользователь не найден")
+        return
 
-        text = f"💰 Баланс: {user.coins} монет"
+    text = f"💰 Баланс: {coins} монет"
     await message.answer(text)
 
 
 @router.message(Command("referrals"), IsPrivateChat())
-async def cmd_referrals(message: types.Message) -> None:
+async def cmd_referrals(message: types.Message, session: AsyncSession) -> None:
     """Обработчик команды /referrals - список рефералов пользователя.
     
     Выводит список пользователей, приглашённых текущим пользователем.
@@ -132,34 +155,42 @@ async def cmd_referrals(message: types.Message) -> None:
     
     Параметры:
         message (types.Message): Telegram сообщение с командой /referrals
+        session (AsyncSession): Сессия БД из DbSessionMiddleware
     
     Возвращает:
         None: Отправляет список рефералов или уведомление об их отсутствии
     """
-    async with AsyncSessionLocal() as session:
-        user = await UserRepository.get_user_by_tg_id(session, message.from_user.id)
-        if not user:
-            await message.answer("❌ Пользователь не найден")
-            return
-
-        referrals = await UserRepository.get_user_referrals(session, user.user_hash)
-        if not referrals:
-            await message.answer(USER_LEXICON["user_referrals_empty"])
-            return
-
-        text = USER_LEXICON["user_referrals_header"]
-        
-        # Show first 30 referrals
-        for referral in referrals[:30]:
-            text += USER_LEXICON["user_referrals_item"].format(
-                tg_id=referral.tg_id,
-                coins=referral.coins,
-            )
-
-        if len(referrals) > 30:
-            text += USER_LEXICON["user_referrals_more"].format(count=len(referrals) - 30)
-
-        await message.answer(text, parse_mode="Markdown")
+    user = await UserRepository.get_user_snapshot(session, message.from_user.id)
+    referrals_count = 0
+    referrals = []
+    if user:
+        referrals_count = await UserRepository.get_referrals_count(session, user.user_hash)
+    if referrals_count:
+        referrals = await UserRepository.get_user_referrals(session, user.user_hash, limit=30)
+    await session.close()
+
+    if not user:
+        await message.answer("❌ Пользователь не найден")
+        return
+    if referrals_count == 0:
+        await message.answer(USER_LEXICON["user_referrals_empty"])
+        return
+
+    parts = [(USER_LEXICON["user_referrals_header"], {})]
+    item_template = USER_LEXICON["user_referrals_item"]
+    
+    # Show first 30 referrals
+    for referral in referrals:
+        parts.append((item_template, {
+            "tg_id": referral.tg_id,
+            "coins": referral.coins,
+        }))
+
+    if referrals_count > 30:
+        parts.append((USER_LEXICON["user_referrals_more"], {"count": referrals_count - 30}))
+
+    text, entities = render_parts(parts)
+    await message.answer(text, entities=entities)
 
 
 @router.message(Command("help"), IsPrivateChat())
@@ -174,5 +205,4 @@ async def cmd_help(message: types.Message) -> None:
     
     Возвращает:
         None: Отправляет справку пользователю"""
-    text = USER_LEXICON["user_help"]
-    await message.answer(text, parse_mode="Markdown")
+    await message.answer(_USER_HELP_TEXT, entities=_USER_HELP_ENTITIES)
@@ -0,0 +1,75 @@
+"""Рендеринг шаблонов лексикона в текст с MessageEntity.
+
+Шаблоны размечены как в Markdown: **жирный** (или *жирный*) и `код`.
+Разметка разбирается один раз на шаблон, значения подставляются уже
+после разбора, поэтому символы *, ` и _ в данных (например, в username)
+не ломают форматирование. Сообщения отправляются с entities=...
+без parse_mode, и Telegram не приходится разбирать разметку.
+"""
+
+import re
+from functools import lru_cache
+from typing import Any, Iterable, Mapping, Optional
+
+from aiogram.types import MessageEntity
+
+_MARKUP_RE = re.compile(r"(\*\*|\*|`)")
+
+
+@lru_cache(maxsize=None)
+def _parse(template: str) -> tuple[tuple[str, Optional[str]], ...]:
+    """Разбить шаблон на куски (текст, тип entity или None)."""
+    segments = []
+    kind = None
+    for token in _MARKUP_RE.split(template):
+        if not token:
+            continue
+        if kind is None and token in ("**", "*"):
+            kind = "bold"
+        elif kind is None and token == "`":
+            kind = "code"
+        elif (kind == "bold" and token in ("**", "*")) or (kind == "code" and token == "`"):
+            kind = None
+        else:
+            segments.append((token, kind))
+    return tuple(segments)
+
+
+def _utf16_len(text: str) -> int:
+    """Длина строки в UTF-16 code units - в них Telegram считает offset/length."""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def render_parts(
+    parts: Iterable[tuple[str, Mapping[str, Any]]]
+) -> tuple[str, list[MessageEntity]]:
+    """Отрендерить последовательность (шаблон, значения) в одно сообщение.
+
+    Параметры:
+        parts: Пары (шаблон лексикона, значения для str.format)
+
+    Возвращает:
+        tuple[str, list[MessageEntity]]: Текст и entities для message.answer
+    """
+    chunks = []
+    entities = []
+    offset = 0
+    for template, values in parts:
+        for piece, kind in _parse(template):
+            text = piece.format_map(values) if values else piece
+            length = _utf16_len(text)
+            if kind and length:
+                entities.append(MessageEntity(type=kind, offset=offset, length=length))
+            chunks.append(text)
+            offset += length
+    return "".join(chunks), entities
+
+
+def render(template: str, **values: Any) -> tuple[str, list[MessageEntity]]:
+    """Отрендерить один шаблон.
+
+    Пример:
+        text, entities = render(USER_LEXICON["user_start"], hash=h, coins=2)
+        await message.answer(text, entities=entities)
+    """
+    return render_parts(((template, values),))
@@ -1,5 +1,7 @@
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 def setup_logging():
     formatter = logging.Formatter(
@@ -19,7 +21,18 @@ def setup_logging():
     console_handler.setFormatter(formatter)
     console_handler.setLevel(logging.INFO)
 
+    # Handlers do blocking I/O (writes, rotation), so they run in the
+    # listener's thread; the event loop only puts records on the queue
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(
+        log_queue, file_handler, console_handler, respect_handler_level=True
+    )
+    listener.start()
+    atexit.register(listener.stop)
+
     logging.basicConfig(
         level=logging.INFO,
-        handlers=[file_handler, console_handler]
+        handlers=[QueueHandler(log_queue)]
     )
+
+    return listener
@@ -0,0 +1,115 @@
+"""Middleware для обработчиков aiogram.
+
+Модуль содержит промежуточные обработчики, подготавливающие общие
+зависимости (например, сессию БД) до вызова фильтров и хендлеров,
+а также middleware запросов к Bot API, ограничивающий частоту отправки.
+"""
+
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from utils.cache import TTLCache
+from utils.limiter import AsyncLimiter
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """Открывает одну сессию БД на апдейт и передаёт её в data["session"].
+
+    Регистрируется как outer middleware, поэтому сессия доступна уже
+    фильтрам (IsHavePodpiska), а не только хендлерам. Хендлеры и фильтры
+    получают её, объявив параметр session: AsyncSession.
+
+    Параметры:
+        session_pool (async_sessionmaker): Фабрика сессий (обычно ReadSessionLocal)
+
+    Примечания:
+        - AsyncSession не берёт соединение из пула до первого запроса,
+          поэтому апдейты без обращений к БД ничего не стоят
+        - Сессия закрывается после завершения обработки апдейта
+        - Хендлер, прочитав данные, сам вызывает await session.close()
+          до ответа: ответ ждёт слота ThrottlingRequestMiddleware, и
+          соединение пула не должно быть занято на это время
+
+    Пример:
+        dp.message.outer_middleware(DbSessionMiddleware(ReadSessionLocal))
+    """
+
+    def __init__(self, session_pool: async_sessionmaker[AsyncSession]) -> None:
+        self.session_pool = session_pool
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        async with self.session_pool() as session:
+            data["session"] = session
+            return await handler(event, data)
+
+
+# Bot API limits: about 30 messages per second for the whole bot
+# and about one message per second to the same chat
+BOT_RATE_LIMIT = 29
+CHAT_RATE_LIMIT = 1
+
+
+class ThrottlingRequestMiddleware(BaseRequestMiddleware):
+    """Ограничивает частоту исходящих запросов к Bot API.
+
+    Каждый метод, адресованный чату (answer, send_message, edit_text...),
+    проходит через лимитер своего чата и общий лимитер бота, поэтому при
+    всплеске нагрузки сообщения встают в очередь, а не получают 429.
+    Запросы без chat_id (getUpdates, setMyCommands) не ограничиваются.
+
+    Параметры:
+        bot_rate (float): Запросов в секунду на весь бот
+        chat_rate (float): Запросов в секунду в один чат
+
+    Примечания:
+        - Лимиты действуют в пределах одного процесса
+        - Лимитеры чатов хранятся в TTLCache и удаляются после простоя
+
+    Пример:
+        bot.session.middleware(ThrottlingRequestMiddleware())
+    """
+
+    def __init__(
+        self,
+        bot_rate: float = BOT_RATE_LIMIT,
+        chat_rate: float = CHAT_RATE_LIMIT,
+    ) -> None:
+        self.chat_rate = chat_rate
+        self.bot_limiter = AsyncLimiter(bot_rate, 1)
+        self.chat_limiters = TTLCache(maxsize=10_000, ttl=60)
+
+    def _chat_limiter(self, chat_id: Any) -> AsyncLimiter:
+        limiter = self.chat_limiters.get(chat_id)
+        if limiter is None:
+            limiter = AsyncLimiter(self.chat_rate, 1)
+            self.chat_limiters.set(chat_id, limiter)
+        return limiter
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        # Per-chat slot first, so one busy chat does not hold bot-wide slots
+        await self._chat_limiter(chat_id).acquire()
+        await self.bot_limiter.acquire()
+        return await make_request(bot, method)
@@ -0,0 +1,84 @@
+"""Простой in-process кеш с ограниченным временем жизни записей.
+
+Используется для горячих чтений из БД (например, проверки подписки),
+где допустимы данные, устаревшие на несколько десятков секунд.
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Словарь с TTL и ограничением размера.
+
+    Записи старше ttl секунд считаются отсутствующими. При превышении
+    maxsize вытесняется самая старая запись. Метод get_or_load
+    гарантирует, что для одного ключа одновременно выполняется
+    только одна загрузка (защита от thundering herd).
+
+    Параметры:
+        maxsize (int): Максимальное количество записей
+        ttl (float): Время жизни записи в секундах
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: dict[Hashable, tuple[float, Any]] = {}
+        self._locks: dict[Hashable, asyncio.Lock] = {}
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Получить значение по ключу или default, если запись устарела."""
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._data.pop(key, None)
+            return default
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Сохранить значение по ключу."""
+        self._data.pop(key, None)
+        if len(self._data) >= self.maxsize:
+            # dict хранит порядок вставки - первая запись самая старая
+            self._data.pop(next(iter(self._data)))
+        self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Удалить запись (инвалидация после изменения данных)."""
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self) -> None:
+        """Очистить кеш."""
+        self._data.clear()
+
+    async def get_or_load(
+        self, key: Hashable, loader: Callable[[], Awaitable[Any]]
+    ) -> Optional[Any]:
+        """Получить значение из кеша или загрузить его через loader.
+
+        Результат None не кешируется, чтобы, например, только что
+        зарегистрированный пользователь не считался отсутствующим.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        try:
+            async with lock:
+                value = self.get(key, _MISSING)
+                if value is _MISSING:
+                    value = await loader()
+                    if value is not None:
+                        self.set(key, value)
+                return value
+        finally:
+            if self._locks.get(key) is lock and not lock.locked():
+                del self._locks[key]
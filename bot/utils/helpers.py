@@ -4,36 +4,75 @@
 включая генерацию хешей и создание/получение профилей.
 """
 
+import asyncio
 import hashlib
+import logging
+import string
+from operator import attrgetter
 from typing import Optional
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from db.requests_db import UserRepository
+from db.database import AsyncSessionLocal
+from db.requests_db import UserRepository, UserSnapshot
+from utils.tasks import spawn
+
+logger = logging.getLogger(__name__)
+
+# Lowercase only: /start lowercases the deep-link argument before lookup
+_HASH_ALPHABET = string.digits + string.ascii_lowercase
+_HASH_BASE = len(_HASH_ALPHABET)
+USER_HASH_LENGTH = 12
 
 
 def generate_user_hash(tg_id: int) -> str:
     """Генерирует уникальный хеш для пользователя на основе его Telegram ID.
     
-    Использует алгоритм SHA256 для создания 64-символьного хеша.
-    Этот хеш служит уникальной реферальной ссылкой для пользователя.
+    Хеш - это tg_id в системе счисления по основанию 36 (0-9, a-z),
+    дополненный нулями слева до 12 символов. Криптографические свойства
+    не нужны: хеш служит лишь идентификатором в реферальной ссылке,
+    а Telegram ID и так не секретен. Кодирование однозначно, поэтому
+    между такими хешами коллизий нет.
+    
+    Хеш сохраняется в users.user_hash при регистрации, поэтому у
+    пользователей, созданных раньше, остаются прежние hex-хеши. Они из
+    того же алфавита и той же длины, так что совпадение с ними возможно;
+    get_or_create_user в этом случае берёт _legacy_user_hash.
     
     Параметры:
         tg_id (int): Telegram ID пользователя
     
     Возвращает:
-        str: 64-символьный хеш SHA256 в шестнадцатеричном формате
+        str: 12-символьный хеш из символов 0-9 и a-z
     
     Пример:
         hash = generate_user_hash(123456789)
-        # Returns: 'abc123...xyz789' (64 символа)
+        # Returns: '00000021i3v9' (12 символов)
     """
-    return hashlib.sha256(str(tg_id).encode()).hexdigest()[:12]
+    digits = []
+    n = tg_id
+    while n:
+        n, remainder = divmod(n, _HASH_BASE)
+        digits.append(_HASH_ALPHABET[remainder])
+    return "".join(reversed(digits)).rjust(USER_HASH_LENGTH, "0")
+
+
+def _legacy_user_hash(tg_id: int) -> str:
+    """Прежний hex-хеш (SHA-256 от tg_id), запасной при совпадении base36-хеша.
+
+    Среди старых хешей он может совпасть только с хешем этого же tg_id,
+    а такой пользователь уже зарегистрирован.
+    """
+    return hashlib.sha256(str(tg_id).encode()).hexdigest()[:USER_HASH_LENGTH]
 
 
 # Размер награды за успешный реферал (в монетах)
 REFERRAL_BONUS = 1
 
+# Keys of the dict returned by get_or_create_user (same for both paths)
+_USER_KEYS = UserSnapshot._fields
+_user_values = attrgetter(*_USER_KEYS)
+
 
 async def get_or_create_user(
     session: AsyncSession, 
@@ -45,7 +84,8 @@ async def get_or_create_user(
     
     Функция проверяет наличие пользователя в БД по Telegram ID.
     Если пользователь не найден:
-    1. Генерирует уникальный хеш (SHA256 от tg_id)
+    1. Генерирует уникальный хеш (generate_user_hash от tg_id, а если он
+       занят старым hex-хешем - _legacy_user_hash)
     2. Проверяет валидность реферального хеша
     3. Валидирует, что пользователь не приглашает себя
     4. Создаёт пользователя с начальным балансом (2 монеты)
@@ -56,7 +96,7 @@ async def get_or_create_user(
         session (AsyncSession): Асинхронная сессия базы данных
         tg_id (int): Telegram ID пользователя
         username (Optional[str]): Username Telegram пользователя, по умолчанию None
-        invited_by_hash (Optional[str]): SHA256 хеш приглашающего, по умолчанию None
+        invited_by_hash (Optional[str]): Хеш приглашающего, по умолчанию None
     
     Возвращает:
         dict: Словарь с данными пользователя:
@@ -66,6 +106,7 @@ async def get_or_create_user(
             - coins: Текущий баланс монет
             - user_hash: Уникальный хеш пользователя
             - invited_count: Количество приглашённых
+            - referral_earnings: Заработок с рефералов
             - subscription_until: Дата окончания подписки
             - invited_by_hash: Хеш приглашающего (если был приглашен)
     
@@ -77,44 +118,73 @@ async def get_or_create_user(
           * Приглашающий получает REFERRAL_BONUS (1 монету)
         - Пользователь не может пригласить себя (валидация по хешу)
     """
-    user = await UserRepository.get_user_by_tg_id(session, tg_id)
-
-    if not user:
-        user_hash = generate_user_hash(tg_id)
-        
-        # Check if invited_by_hash is valid (user with this hash exists)
-        inviter = None
-        if invited_by_hash:
-            inviter = await UserRepository.get_user_by_hash(session, invited_by_hash)
-            
-            # Валидация: пользователь не может приглашать себя
-            if inviter and inviter.user_hash == user_hash:
-                inviter = None
-        
-        # Create user with referral tracking
-        user = await UserRepository.create_user(
+    # Existing users: narrow column select (or the snapshot cache), no ORM object
+    snapshot = await UserRepository.get_user_snapshot(session, tg_id)
+    if snapshot:
+        return snapshot._asdict()
+
+    # Inviter validation (exists, not self), the invited_count increment
+    # and the bonus are all done by the repository in one transaction
+    for user_hash in (generate_user_hash(tg_id), _legacy_user_hash(tg_id)):
+        user = await UserRepository.create_user_with_referral(
             session=session,
             tg_id=tg_id,
             user_hash=user_hash,
             username=username,
-            invited_by_hash=inviter.user_hash if inviter else None,
+            invited_by_hash=invited_by_hash,
+            referral_bonus=REFERRAL_BONUS,
         )
-        
-        # Increment inviter's invited count and give reward
-        if inviter:
-            await UserRepository.increment_invited_count(session, inviter.id)
-            await UserRepository.add_coins(session, inviter.id, REFERRAL_BONUS)
+        if user is not None:
+            return dict(zip(_USER_KEYS, _user_values(user)))
 
-    return {
-        "id": user.id,
-        "tg_id": user.tg_id,
-        "username": user.username,
-        "coins": user.coins,
-        "user_hash": user.user_hash,
-        "invited_count": user.invited_count,
-        "subscription_until": user.subscription_until,
-        "invited_by_hash": user.invited_by_hash,
-    }
+        # Created concurrently by another update between the two queries
+        snapshot = await UserRepository.get_user_snapshot(session, tg_id)
+        if snapshot:
+            return snapshot._asdict()
+        # Otherwise user_hash is taken by a legacy hex hash: try the next one
+
+    raise RuntimeError(f"No free user_hash for tg_id {tg_id}")
+
+
+# Фоновые начисления пригласившим ждут здесь, а не в пуле пишущих
+# соединений (pool_size=1, pool_timeout=10), иначе всплеск платежей
+# упирался бы в таймаут пула
+REFERRER_CREDIT_CONCURRENCY = 1
+_referrer_credit_slots = asyncio.Semaphore(REFERRER_CREDIT_CONCURRENCY)
+
+
+async def _credit_referrer_in_background(inviter_hash: str, payment_amount: float) -> None:
+    """Начислить вознаграждение пригласившему в отдельной сессии.
+
+    Если начисление не прошло, в лог пишутся inviter_hash и сумма
+    платежа - по ним начисление можно повторить вручную.
+    """
+    try:
+        async with _referrer_credit_slots:
+            async with AsyncSessionLocal() as session:
+                credited = await UserRepository.credit_referrer(
+                    session, inviter_hash, payment_amount
+                )
+    except asyncio.CancelledError:
+        logger.error(
+            "Referrer credit cancelled: inviter_hash=%s payment_amount=%s",
+            inviter_hash, payment_amount,
+        )
+        raise
+    except Exception:
+        logger.exception(
+            "Referrer credit failed: inviter_hash=%s payment_amount=%s",
+            inviter_hash, payment_amount,
+        )
+        return
+    if credited:
+        referrer_id, bonus = credited
+        logger.info("Referrer %s credited with %s", referrer_id, bonus)
+    else:
+        logger.warning(
+            "Referrer not found: inviter_hash=%s payment_amount=%s",
+            inviter_hash, payment_amount,
+        )
 
 
 async def process_referral_payment(
@@ -127,10 +197,11 @@ async def process_referral_payment(
     """Обрабатывает платеж пользователя и начисляет реферальное вознаграждение пригласившему.
     
     Функция:
-    1. Добавляет монеты пользователю
-    2. Продлевает подписку пользователя
-    3. Находит пригласившего пользователя (реферала)
-    4. Начисляет процент от суммы платежа пригласившему
+    1. Добавляет монеты пользователю и продлевает подписку (одним UPDATE)
+    2. Ставит в фон начисление пригласившему процента от суммы платежа
+    
+    Начисление пригласившему не задерживает ответ плательщику: оно
+    выполняется фоновой задачей в собственной сессии БД, ошибки пишутся в лог.
     
     Параметры:
         session (AsyncSession): Асинхронная сессия базы данных
@@ -144,53 +215,26 @@ async def process_referral_payment(
             - success: bool - Успешность операции
             - user_coins_added: int - Добавленные монеты пользователю
             - user_days_added: int - Добавленные дни подписки
-            - referrer_bonus: float - Начисленное вознаграждение пригласившему (если есть)
-            - referrer_id: int - ID пригласившего (если есть)
+            - referrer_pending: bool - Поставлено ли в очередь начисление пригласившему
     """
-    # Получаем пользователя
-    user = await UserRepository.get_user_by_id(session, user_id)
-    if not user:
-        return {
-            "success": False,
-            "error": "User not found"
-        }
-    
-    # Добавляем монеты пользователю
-    updated_user = await UserRepository.add_coins(session, user_id, coins_to_add)
+    # Добавляем монеты и продлеваем подписку одним UPDATE
+    # (дни отсчитываются от max(даты окончания, текущего момента)).
+    # RETURNING заменяет предварительный SELECT: нет строки - нет пользователя
+    updated_user = await UserRepository.apply_grant(session, user_id, coins_to_add, days_to_add)
     if not updated_user:
         return {
             "success": False,
-            "error": "Failed to add coins to user"
+            "error": "User not found"
         }
     
-    # Продлеваем подписку пользователя
-    updated_user = await UserRepository.extend_subscription(session, user_id, days_to_add)
-    if not updated_user:
-        return {
-            "success": False,
-            "error": "Failed to extend user subscription"
-        }
+    # Вознаграждение пригласившему - в фоне, со своей сессией
+    referrer_pending = bool(updated_user.invited_by_hash)
+    if referrer_pending:
+        spawn(_credit_referrer_in_background(updated_user.invited_by_hash, payment_amount))
     
-    result = {
+    return {
         "success": True,
         "user_coins_added": coins_to_add,
         "user_days_added": days_to_add,
-        "referrer_bonus": 0,
-        "referrer_id": None
+        "referrer_pending": referrer_pending,
     }
-    
-    # Проверяем, есть ли у пользователя пригласивший
-    if user.invited_by_hash:
-        # Находим пригласившего пользователя
-        referrer = await UserRepository.get_user_by_hash(session, user.invited_by_hash)
-        if referrer:
-            # Рассчитываем вознаграждение (процент от суммы платежа)
-            bonus_amount = int(payment_amount * referrer.referral_percentage / 100)
-            
-            # Начисляем вознаграждение пригласившему
-            updated_referrer = await UserRepository.add_referral_earnings(session, referrer.id, bonus_amount)
-            if updated_referrer:
-                result["referrer_bonus"] = bonus_amount
-                result["referrer_id"] = referrer.id
-    
-    return result
@@ -0,0 +1,55 @@
+"""Асинхронный ограничитель частоты (leaky bucket).
+
+Позволяет не более max_rate захватов за time_period секунд, сглаживая
+всплески. Ожидающие обслуживаются в порядке очереди (FIFO), поэтому
+запросы выстраиваются по очереди, а не соревнуются за свободный слот.
+"""
+
+import asyncio
+import time
+
+
+class AsyncLimiter:
+    """Ограничитель частоты для использования через async with.
+
+    Параметры:
+        max_rate (float): Максимальное количество захватов за time_period
+        time_period (float): Длина окна в секундах, по умолчанию 1
+
+    Пример:
+        limiter = AsyncLimiter(29, 1)
+        async with limiter:
+            await bot.send_message(...)
+    """
+
+    def __init__(self, max_rate: float, time_period: float = 1.0) -> None:
+        self.max_rate = max_rate
+        self.time_period = time_period
+        self._rate_per_sec = max_rate / time_period
+        self._level = 0.0
+        self._last_check = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _leak(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._last_check
+        self._level = max(self._level - elapsed * self._rate_per_sec, 0.0)
+        self._last_check = now
+
+    async def acquire(self) -> None:
+        """Дождаться свободного слота и занять его."""
+        # asyncio.Lock будит ожидающих по очереди - отсюда FIFO
+        async with self._lock:
+            self._leak()
+            while self._level + 1 > self.max_rate:
+                await asyncio.sleep(
+                    (self._level + 1 - self.max_rate) / self._rate_per_sec
+                )
+                self._leak()
+            self._level += 1
+
+    async def __aenter__(self) -> None:
+        await self.acquire()
+
+    async def __aexit__(self, *exc_info) -> None:
+        return None
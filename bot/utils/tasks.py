@@ -0,0 +1,49 @@
+"""Запуск фоновых awaitable без ожидания результата.
+
+Цикл событий хранит на задачи только слабые ссылки, поэтому задача,
+на которую никто не ссылается, может быть собрана сборщиком мусора
+до завершения. spawn держит ссылку до конца выполнения задачи,
+а wait_background_tasks дожидается оставшихся задач при остановке бота.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Optional
+
+logger = logging.getLogger(__name__)
+
+_background_tasks: set[asyncio.Future] = set()
+
+
+def _on_done(task: asyncio.Future) -> None:
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background task failed", exc_info=task.exception())
+
+
+def spawn(aw: Awaitable[Any]) -> asyncio.Future:
+    """Запустить awaitable в фоне и вернуть созданную задачу.
+
+    Принимает не только корутины: message.answer(...) в aiogram 3
+    возвращает объект метода (SendMessage), который является awaitable,
+    но не корутиной, и asyncio.create_task его не принимает.
+    Исключения задачи не теряются молча, а пишутся в лог.
+    """
+    task = asyncio.ensure_future(aw)
+    _background_tasks.add(task)
+    task.add_done_callback(_on_done)
+    return task
+
+
+async def wait_background_tasks(timeout: Optional[float] = None) -> None:
+    """Дождаться запущенных через spawn задач.
+
+    Вызывается при остановке бота до закрытия подключений к БД.
+    Задачи, не успевшие завершиться за timeout секунд, пишутся в лог
+    и отменяются вместе с циклом событий.
+    """
+    if not _background_tasks:
+        return
+    _, pending = await asyncio.wait(set(_background_tasks), timeout=timeout)
+    if pending:
+        logger.warning("%d background task(s) still running at shutdown", len(pending))